@@ -1,11 +1,11 @@
-from datetime import date
+from datetime import date, datetime
 from typing import List, Optional
 from openpyxl import load_workbook
 from app.club_members.schemas import ClubMemberSchema
 
 
 class ClubMembers:
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, database_id_columns: Optional[List[str]] = None):
         self.filename = filename
         self.members: List[ClubMemberSchema] = []
 
@@ -17,6 +17,17 @@ class ClubMembers:
         idx_name = headers.index("Name")
         idx_spreadsheet = headers.index("Spreadsheet Key")
         idx_sync_count = headers.index("Sync Count") if "Sync Count" in headers else 0
+        # Optional, used for logbooks exported without a Google spreadsheet
+        idx_instructor = headers.index("Instructor") if "Instructor" in headers else None
+        idx_instructor_from = (
+            headers.index("Instructor From") if "Instructor From" in headers else None
+        )
+        # Member IDs of databases that don't share the Club ID
+        idx_database_ids = {}
+        for column in database_id_columns or []:
+            if column not in headers:
+                raise ValueError(f"Column {column} not found in {filename}")
+            idx_database_ids[column] = headers.index(column)
 
         for row in sheet.iter_rows(min_row=2, values_only=True):
             raw_club_id = row[idx_club_id]
@@ -31,11 +42,30 @@ class ClubMembers:
             if idx_sync_count is not None and row[idx_sync_count] is not None:
                 sync_count = row[idx_sync_count]
 
+            is_instructor = False
+            if idx_instructor is not None:
+                is_instructor = row[idx_instructor] == "Yes"
+
+            instructor_from_date = None
+            if idx_instructor_from is not None and row[idx_instructor_from] is not None:
+                instructor_from_date = row[idx_instructor_from]
+                if isinstance(instructor_from_date, datetime):
+                    instructor_from_date = instructor_from_date.date()
+
+            database_ids = {
+                column: int(row[idx])
+                for column, idx in idx_database_ids.items()
+                if row[idx] is not None
+            }
+
             member = ClubMemberSchema(
                 club_id=club_id,
                 name=name,
                 spreadsheet_key=spreadsheet_key,
                 sync_date=sync_date,
+                is_instructor=is_instructor,
+                instructor_from_date=instructor_from_date,
+                database_ids=database_ids,
             )
             self.members.append(member)
 
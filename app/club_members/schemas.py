@@ -1,3 +1,5 @@
+from datetime import date
+from typing import Dict, Optional
 from pydantic import BaseModel
 
 
@@ -5,4 +7,8 @@ class ClubMemberSchema(BaseModel):
     club_id: int
     name: str
     spreadsheet_key: str
-    sync_count: int = 0
\ No newline at end of file
+    sync_count: int = 0
+    is_instructor: bool = False
+    instructor_from_date: Optional[date] = None
+    # Member ID column name -> member's ID in that database
+    database_ids: Dict[str, int] = {}
@@ -0,0 +1,181 @@
+import json
+import os
+from typing import Dict, List, Optional, Set, Tuple
+import pandas as pd
+
+from app.club_members.schemas import ClubMemberSchema
+from app.databases.schemas import DatabaseSchema
+from app.flights import FlightPreparationCache
+from app.flights.schemas import FlightSchema
+
+
+FLIGHT_TIME_TABLE = "tblFlightTime"
+LOOKUP_TABLES = ["tblGliderDetails", "TblGliderType", "tblMember"]
+
+
+def load_databases() -> List[DatabaseSchema]:
+    """
+    Databases listed in the DATABASES_CONFIG JSON file, e.g.
+    [{"path": "...", "place_name": "...", "default_launch_type": "..."}, ...]
+    or the single DATABASE_PATH / PLACE_NAME / DEFAULT_LAUNCH_TYPE database.
+
+    P1 / P2 of a database are expected to be Club IDs, unless "member_id_column"
+    names the Members.xlsx column with members' IDs in that database.
+    """
+    config_path = os.getenv("DATABASES_CONFIG")
+    if config_path:
+        with open(config_path, encoding="utf-8") as f:
+            return [DatabaseSchema(**i) for i in json.load(f)]
+    return [
+        DatabaseSchema(
+            path=os.getenv("DATABASE_PATH"),
+            place_name=os.getenv("PLACE_NAME"),
+            default_launch_type=os.getenv("DEFAULT_LAUNCH_TYPE"),
+        )
+    ]
+
+
+class FlightDatabase:
+    """
+    Tables of one Access database. AutoIDs and lookup tables are only unique
+    within a database, so every database has its own flight preparation cache.
+    """
+
+    def __init__(self, database: DatabaseSchema):
+        self.database = database
+        self.path = os.path.abspath(database.path)
+        self.glider_daetails_dict = {}
+        self.glider_dict = {}
+        self.member_dict = {}
+        # Club ID <-> member ID in this database
+        self.club_to_member_id: Dict[int, int] = {}
+        self.member_to_club_id: Dict[int, int] = {}
+        self.df_flight_time = pd.DataFrame()
+        self.flight_time_snapshot = {}
+        self.flight_cache = FlightPreparationCache(
+            database.place_name, database.default_launch_type, source=self.path
+        )
+
+    def set_members(self, members: List[ClubMemberSchema]):
+        column = self.database.member_id_column
+        self.club_to_member_id = {}
+        for member in members:
+            if column is None:
+                self.club_to_member_id[member.club_id] = member.club_id
+            elif column in member.database_ids:
+                self.club_to_member_id[member.club_id] = member.database_ids[column]
+        self.member_to_club_id = {
+            member_id: club_id for club_id, member_id in self.club_to_member_id.items()
+        }
+
+    def get_club_id(self, member_id) -> Optional[int]:
+        if member_id is None or pd.isna(member_id):
+            return None
+        return self.member_to_club_id.get(int(member_id))
+
+    def set_lookup_tables(self, tables: Dict[str, dict]):
+        table_glider_daetails_dict = tables["tblGliderDetails"]
+        table_glider_type_dict = tables["TblGliderType"]
+        table_member_dict = tables["tblMember"]
+
+        self.glider_daetails_dict = dict(
+            zip(table_glider_daetails_dict["AutoID"], table_glider_daetails_dict["GliderID"])
+        )
+        self.glider_dict = dict(
+            zip(table_glider_type_dict["TypeId"], table_glider_type_dict["GliderType"])
+        )
+        self.member_dict = dict(zip(table_member_dict["MemberID"], table_member_dict["Name"]))
+        self.flight_cache.set_lookup_tables(
+            self.glider_daetails_dict, self.glider_dict, self.member_dict
+        )
+
+    def make_flight_time(self, table_flight_time_dict: dict) -> pd.DataFrame:
+        df_flight_time = pd.DataFrame(table_flight_time_dict)
+        df_flight_time["DateFlown"] = pd.to_datetime(
+            df_flight_time["DateFlown"], errors="coerce"
+        )
+        return df_flight_time
+
+    def get_changed_flights(
+        self, df_flight_time: pd.DataFrame, snapshot: dict
+    ) -> pd.DataFrame:
+        """
+        Flights of a new tblFlightTime that were added or changed since the
+        current one, nothing is stored.
+        """
+        old_snapshot = self.flight_time_snapshot
+        changed_ids = [
+            auto_id
+            for auto_id, values in snapshot.items()
+            if old_snapshot.get(auto_id) != values
+        ]
+        return df_flight_time[df_flight_time["AutoID"].isin(changed_ids)]
+
+    def set_flight_time(
+        self, df_flight_time: pd.DataFrame, snapshot: Optional[dict] = None
+    ) -> Tuple[pd.DataFrame, List[FlightSchema]]:
+        """
+        Replaces tblFlightTime and returns the flights that were added or
+        changed since the previous call, together with the previous versions
+        of the changed ones.
+        """
+        if snapshot is None:
+            snapshot = self.make_snapshot(df_flight_time)
+        changed_flights = self.get_changed_flights(df_flight_time, snapshot)
+        old_df_flight_time = self.df_flight_time
+        old_rows = []
+        if not old_df_flight_time.empty:
+            old_rows = old_df_flight_time[
+                old_df_flight_time["AutoID"].isin(changed_flights["AutoID"])
+            ].to_dict("records")
+        self.df_flight_time = df_flight_time
+        self.flight_time_snapshot = snapshot
+        return changed_flights, self.flight_cache.invalidate(old_rows)
+
+    def make_snapshot(self, df_flight_time: pd.DataFrame) -> dict:
+        return dict(
+            zip(
+                df_flight_time["AutoID"],
+                df_flight_time.astype(str).itertuples(index=False, name=None),
+            )
+        )
+
+    def has_unknown_references(self, flights: pd.DataFrame) -> bool:
+        for _, row in flights.iterrows():
+            if row["GliderID"] not in self.glider_daetails_dict:
+                return True
+            if row["GliderType"] not in self.glider_dict:
+                return True
+            for pilot in (row["P1"], row["P2"]):
+                if not pd.isna(pilot) and pilot not in self.member_dict:
+                    return True
+        return False
+
+    def get_member_ids(self, flights: pd.DataFrame) -> Set[int]:
+        """
+        Club IDs of members who flew the flights, pilots who are not in
+        Members.xlsx are left out.
+        """
+        member_ids = set(flights["P1"].dropna()) | set(flights["P2"].dropna())
+        club_ids = {self.get_club_id(i) for i in member_ids}
+        return {i for i in club_ids if i is not None}
+
+    def get_member_name(self, club_id: int) -> Optional[str]:
+        member_id = self.club_to_member_id.get(club_id)
+        if member_id is None:
+            return None
+        return self.member_dict.get(member_id)
+
+    def get_member_flights(self, club_id: int) -> List[FlightSchema]:
+        member_id = self.club_to_member_id.get(club_id)
+        if member_id is None:
+            return []
+        df_flight_time = self.df_flight_time
+        pilot_flights = df_flight_time[
+            (df_flight_time["P1"] == member_id)
+            | (df_flight_time["P2"] == member_id)
+        ]
+        flights = [
+            self.flight_cache.prepare(row) for row in pilot_flights.to_dict("records")
+        ]
+        return [i for i in flights if i is not None]
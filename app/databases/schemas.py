@@ -0,0 +1,11 @@
+from typing import Optional
+from pydantic import BaseModel
+
+
+class DatabaseSchema(BaseModel):
+    path: str
+    place_name: Optional[str] = None
+    default_launch_type: Optional[str] = None
+    # Members.xlsx column with members' IDs in this database's tblMember,
+    # without it the Club ID is used
+    member_id_column: Optional[str] = None
@@ -2,17 +2,17 @@ import os
 import platform
 
 
-def read_table(table_name):
+def read_table(table_name, db_path=None):
+    db_path = db_path or os.getenv("DATABASE_PATH")
     if platform.system() == 'Windows':
-        return read_table_windows(table_name)
+        return read_table_windows(table_name, db_path)
     elif platform.system() == 'Darwin':
-        return read_table_macos(table_name)
+        return read_table_macos(table_name, db_path)
     else:
         raise Exception("Unsupported OS")
 
-def read_table_windows(table_name):
+def read_table_windows(table_name, db_path):
     import pyodbc
-    db_path = os.getenv("DATABASE_PATH")
     conn = pyodbc.connect(f"DRIVER={{Microsoft Access Driver (*.mdb, *.accdb)}};DBQ={db_path}")
 
     cursor = conn.cursor()
@@ -30,9 +30,12 @@ def read_table_windows(table_name):
     return table_dict
 
 
-def read_table_macos(table_name):
+def read_table_macos(table_name, db_path):
     from access_parser import AccessParser
-    db_path = os.getenv("DATABASE_PATH")
     db = AccessParser(db_path)
     return db.parse_table(table_name)
 
+
+
+def read_tables(table_names, db_path=None):
+    return {table_name: read_table(table_name, db_path) for table_name in table_names}
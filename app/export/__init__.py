@@ -0,0 +1,64 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+from typing import Iterable, List, Optional
+from tqdm import tqdm
+
+from app.club_members.schemas import ClubMemberSchema
+from app.flights.schemas import FlightSchema
+from app.pilot_logbook.local import LocalLogBook
+from app.sync import LogbookSync, add_flights
+
+
+def get_export_filename(output_dir: str, member: ClubMemberSchema, file_format: str) -> str:
+    name = "".join(i for i in member.name if i.isalnum() or i in " -_").strip()
+    return os.path.join(output_dir, f"{member.club_id} {name}.{file_format}")
+
+
+def export_logbook(
+    filename: str, pilot_name: str, member: ClubMemberSchema, flights: List[FlightSchema]
+) -> int:
+    logbook = LocalLogBook(
+        filename,
+        pilot_name,
+        is_instructor=member.is_instructor,
+        instructor_from_date=member.instructor_from_date,
+    )
+    count = add_flights(logbook, flights)
+    logbook.save_aircraft_model()
+    logbook.save_flight_log_glider()
+    logbook.finalize()
+    return count
+
+
+def export_logbooks(
+    logbook_sync: LogbookSync,
+    members: Iterable[ClubMemberSchema],
+    output_dir: str,
+    file_format: str = "xlsx",
+    workers: Optional[int] = None,
+):
+    """
+    Writes the logbook of every member to `output_dir` in one pass. Flights are
+    prepared once in this process, the files are written by a process pool.
+    Existing files are updated, only new flights are added to them.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for member in members:
+            flights = logbook_sync.get_member_flights(member)
+            if not flights:
+                continue
+            filename = get_export_filename(output_dir, member, file_format)
+            pilot_name = logbook_sync.get_member_name(member)
+            futures[
+                executor.submit(export_logbook, filename, pilot_name, member, flights)
+            ] = member
+
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Export logbooks"):
+            member = futures[future]
+            try:
+                count = future.result()
+                tqdm.write(f"Exported {count} new rows for {member.name}")
+            except Exception as e:
+                tqdm.write(f"Error export logbook for {member.name} - {e}")
@@ -0,0 +1,96 @@
+from typing import Dict, Iterable, List, Optional
+import pandas as pd
+
+from app.flights.schemas import FlightSchema
+from app.helpers import SortDirection, normalize_flight_time, normalize_time
+
+
+class FlightPreparationCache:
+    """
+    Prepares every tblFlightTime row once, keyed by its AutoID: looks up the
+    glider and pilot names and normalizes launch/land times. Two-seater flights
+    are then fanned out to both pilots' logbooks from the same prepared flight.
+    """
+
+    def __init__(self, place_name: str, default_launch_type: str, source: str = ""):
+        self.place_name = place_name
+        self.default_launch_type = default_launch_type
+        self.source = source
+        self.glider_daetails_dict = {}
+        self.glider_dict = {}
+        self.member_dict = {}
+        self.flights: Dict[int, Optional[FlightSchema]] = {}
+
+    def set_lookup_tables(self, glider_daetails_dict: dict, glider_dict: dict, member_dict: dict):
+        self.glider_daetails_dict = glider_daetails_dict
+        self.glider_dict = glider_dict
+        self.member_dict = member_dict
+        # Prepared flights hold names resolved from the old tables
+        self.flights = {}
+
+    def invalidate(self, old_rows: Iterable[dict]) -> List[FlightSchema]:
+        """
+        Drops the prepared flights of the previous versions of changed rows and
+        returns those versions, so rows written from them can be found and
+        replaced. Flights that are not prepared anymore (e.g. after the lookup
+        tables were re-read) are prepared again from the old row.
+        """
+        flights = []
+        for row in old_rows:
+            flight = self.flights.pop(row["AutoID"], None) or self._prepare(row)
+            if flight is not None:
+                flights.append(flight)
+        return flights
+
+    def prepare(self, row: dict) -> Optional[FlightSchema]:
+        auto_id = row["AutoID"]
+        if auto_id not in self.flights:
+            self.flights[auto_id] = self._prepare(row)
+        return self.flights[auto_id]
+
+    def _prepare(self, row: dict) -> Optional[FlightSchema]:
+        if pd.isna(row["DateFlown"]):
+            return None
+        if pd.isna(row["P2"]):
+            name_p2 = ""
+        else:
+            name_p2 = self.member_dict.get(row["P2"], "<hidden>")
+        departure_time = normalize_time(row["LaunchTime"])
+        arrival_time = normalize_time(row["LandTime"])
+        return FlightSchema(
+            source=self.source,
+            auto_id=row["AutoID"],
+            date_flown=pd.Timestamp(row["DateFlown"]).to_pydatetime(),
+            p1=self._get_member_id(row["P1"]),
+            p2=self._get_member_id(row["P2"]),
+            name_p1=self.member_dict.get(row["P1"]),
+            name_p2=name_p2,
+            glider_model=self.glider_dict.get(row["GliderType"]),
+            glider_registration=self.glider_daetails_dict.get(row["GliderID"]),
+            departure_place=self.place_name,
+            departure_time=departure_time,
+            arrival_place=self.place_name,
+            arrival_time=arrival_time,
+            type_of_launch=self.default_launch_type,
+            landings=1,
+            # Missing times are stored as empty cells and read back as "",
+            # so they have to be "" in the ID as well
+            flight_log_id_tail=(
+                f"{self.place_name}{normalize_flight_time(departure_time or '')}"
+                f"{self.place_name}{normalize_flight_time(arrival_time or '')}"
+            ),
+        )
+
+    def _get_member_id(self, value) -> Optional[int]:
+        if pd.isna(value):
+            return None
+        return int(value)
+
+
+def sort_flights(flights: Iterable[FlightSchema], sort_direction: str) -> List[FlightSchema]:
+    # Sorting by DateFlown, LaunchTime, LandTime
+    return sorted(
+        flights,
+        key=lambda i: (i.date_flown, i.departure_time or "", i.arrival_time or ""),
+        reverse=sort_direction != SortDirection.NEWEST_LAST,
+    )
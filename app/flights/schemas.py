@@ -0,0 +1,25 @@
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel
+
+
+class FlightSchema(BaseModel):
+    # Path of the database the flight comes from, AutoIDs are only unique within it
+    source: str = ""
+    auto_id: int
+    date_flown: datetime
+    p1: Optional[int] = None
+    p2: Optional[int] = None
+    name_p1: Optional[str] = None
+    name_p2: str = ""
+    glider_model: Optional[str] = None
+    glider_registration: Optional[str] = None
+    departure_place: Optional[str] = None
+    departure_time: Optional[str] = None
+    arrival_place: Optional[str] = None
+    arrival_time: Optional[str] = None
+    type_of_launch: Optional[str] = None
+    landings: int = 1
+    # Everything of the flight log ID except the date, which depends on the
+    # date format of the logbook the flight is written to.
+    flight_log_id_tail: str = ""
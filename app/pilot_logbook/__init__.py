@@ -1,5 +1,8 @@
 from datetime import date, datetime
+import hashlib
+import json
 import os
+from typing import Optional
 import gspread
 from gspread_formatting import (
     CellFormat, 
@@ -13,96 +16,172 @@ from gspread_formatting import (
     format_cell_range,
     get_conditional_format_rules,
 )
-import pandas as pd
 from app.helpers import (
     SortDirection,
     get_date_format, 
     get_sort_direction, 
-    normalize_date, 
-    normalize_flight_date, 
-    normalize_flight_time,
 )
+from app.pilot_logbook.base import BaseLogBook
+from app.pilot_logbook.mirror import LogbookMirror
 from googleapiclient.discovery import build
 
 
 LOGBOOK_FIXED_ROWS = os.getenv("LOGBOOK_FIXED_ROWS", 2)
 
-class PilotLogBook:
-    def __init__(self, credentials, spreadsheet_key: str):
-        aircraft_model_sheet_name = "Aircraft model"
-        flight_log_glider_sheet_name = "FlightLogGlider"
-        summary_glider_sheet_name = "Summary Glider"
+class PilotLogBook(BaseLogBook):
+    aircraft_model_sheet_name = "Aircraft model"
+    flight_log_glider_sheet_name = "FlightLogGlider"
+    summary_glider_sheet_name = "Summary Glider"
+
+    def __init__(
+        self,
+        credentials,
+        spreadsheet_key: str,
+        gc: gspread.Client = None,
+        mirror: Optional[LogbookMirror] = None,
+        service=None,
+    ):
         self.credentials = credentials
-        self.gc = gspread.authorize(credentials)
+        self.gc = gc or gspread.authorize(credentials)
+        self._service = service
         self.spreadsheet_key = spreadsheet_key
+        self.mirror = mirror
         self.document = self.gc.open_by_key(spreadsheet_key)
+        self.refresh()
 
-        # Summary Glider
-        self.worksheet_summary_glider = self.document.worksheet(
-            summary_glider_sheet_name
+    def refresh(self):
+        """
+        Reads the logbook state again, e.g. before an open logbook is reused.
+        The state kept in the mirror is used if the sentinel ranges are
+        unchanged, otherwise the logbook is read in full. Rows that were not
+        saved yet are dropped.
+        """
+        worksheets = {i.title: i for i in self.document.worksheets()}
+        self.worksheet_summary_glider = worksheets[self.summary_glider_sheet_name]
+        self.worksheet_aircraft_model = worksheets[self.aircraft_model_sheet_name]
+        self.worksheet_flight_log_glider = worksheets[self.flight_log_glider_sheet_name]
+
+        # Summary Glider cells and, if the logbook is in the mirror, the sentinel
+        # ranges to validate it are read in one request
+        mirror_state = (
+            self.mirror.get(self.spreadsheet_key) if self.mirror is not None else None
         )
-        self.pilot_name = self.worksheet_summary_glider.acell("B1").value
+        ranges = [
+            f"'{self.summary_glider_sheet_name}'!B1",
+            f"'{self.summary_glider_sheet_name}'!G1:G2",
+        ]
+        if mirror_state is not None:
+            ranges += self._get_sentinel_ranges(
+                mirror_state["next_row_index"], len(mirror_state["aircraft_models"])
+            )
+        value_ranges = self.document.values_batch_get(ranges)["valueRanges"]
+
+        # Summary Glider
+        pilot_name = self._get_cell_value(value_ranges[0], 0)
 
         # Instructor
-        self.is_instructor = (
-            True if self.worksheet_summary_glider.acell("G1").value == "Yes" else False
+        is_instructor = (
+            True if self._get_cell_value(value_ranges[1], 0) == "Yes" else False
         )
-        _instructor_from_date = self.worksheet_summary_glider.acell("G2").value
+        _instructor_from_date = self._get_cell_value(value_ranges[1], 1)
         if _instructor_from_date:
-            self.instructor_from_date = datetime.strptime(
+            instructor_from_date = datetime.strptime(
                 _instructor_from_date, "%Y-%m-%d"
             ).date()
         else:
-            self.instructor_from_date = None
-        
+            instructor_from_date = None
+        super().__init__(pilot_name, is_instructor, instructor_from_date)
+
+        if (
+            mirror_state is not None
+            and self._get_checksum(value_ranges[2:]) == mirror_state["checksum"]
+        ):
+            self._load_mirror_state(mirror_state)
+        else:
+            self._read_logbook()
+            self.save_mirror()
+
+    def _read_logbook(self):
         # Aircraft models
-        self.worksheet_aircraft_model = self.document.worksheet(
-            aircraft_model_sheet_name
-        )
         self.aircraft_models = self.worksheet_aircraft_model.get_all_values()
-        self.aircraft_models_to_add = []
-        self.aircraft_models_to_add_row_index = None
+        self.registrations = {i[1].lower() for i in self.aircraft_models}
 
         # Flight log glider
-        self.worksheet_flight_log_glider =self.document.worksheet(flight_log_glider_sheet_name)
         self.flight_log_glider = [
             i for i in self.worksheet_flight_log_glider.get_all_values() if i[0]
         ]
         self.date_format = get_date_format([i[0] for i in self.flight_log_glider[:10]])
         self.sort_direction = get_sort_direction(self.flight_log_glider[LOGBOOK_FIXED_ROWS-1:])
-        self.flight_log_id_list = [
+        self.flight_log_ids = {
             self._make_flight_log_id(i) for i in self.flight_log_glider
-        ]
-        self.flight_log_glider_to_add = []
+        }
         self.flight_log_glider_to_add_row_index = max(
             len(self.worksheet_flight_log_glider.col_values(1)), LOGBOOK_FIXED_ROWS
         ) + 1
 
-    def _get_formula(self, key: str):
-        formula_dict = {
-            "glider_model": """=IF(G{row_index}="";"";XLOOKUP(G{row_index};'Aircraft model'!$B$1:$B$1000;'Aircraft model'!$A$1:$A$1000;""))""",
-            "total_time_flights": '=IF(G{row_index}>0;I{row_index}-G{row_index};"")',
-            # "pic_time": f"""=IF(K{row_index}='Summary Glider'!$B$1;E{row_index}-C{row_index};"")""",
-            # "dual_time": f"""=IF(K{row_index}='Summary Glider'!$B$1;"";IF(L{row_index}='Summary Glider'!$B$1;E{row_index}-C{row_index};""))""",
-            # "instructor_time": f"""=IF(M{row_index}=TRUE;E{row_index}-C{row_index};"")""",
-            "pic_time": """=IF(B{row_index}='Summary Glider'!$B$1,I{row_index}-G{row_index},"")""",
-            "dual_time": """=IF(B{row_index}='Summary Glider'!$B$1,"",IF(C{row_index}='Summary Glider'!$B$1,I{row_index}-G{row_index},""))""",
-            "instructor_time": """=IF(M{row_index}=TRUE,I{row_index}-G{row_index},"")""",
-        }
-        return formula_dict.get(key, "")
-    
+    def _load_mirror_state(self, mirror_state: dict):
+        self.aircraft_models = mirror_state["aircraft_models"]
+        self.registrations = {i[1].lower() for i in self.aircraft_models}
+        self.date_format = mirror_state["date_format"]
+        self.sort_direction = mirror_state["sort_direction"]
+        self.flight_log_ids = set(mirror_state["flight_log_ids"])
+        self.flight_log_glider_to_add_row_index = mirror_state["next_row_index"]
+
+    def _get_cell_value(self, value_range: dict, row: int):
+        try:
+            return value_range.get("values", [])[row][0]
+        except IndexError:
+            return None
+
+    def _get_sentinel_ranges(self, next_row_index: int, aircraft_models_count: int) -> list:
+        flight_log_glider = self.flight_log_glider_sheet_name
+        aircraft_model = self.aircraft_model_sheet_name
+        return [
+            f"'{flight_log_glider}'!A{LOGBOOK_FIXED_ROWS + 1}:P{LOGBOOK_FIXED_ROWS + 3}",
+            f"'{flight_log_glider}'!A{max(next_row_index - 2, 1)}:P{next_row_index}",
+            f"'{aircraft_model}'!A{max(aircraft_models_count - 1, 1)}:B{aircraft_models_count + 1}",
+        ]
+
+    def _get_checksum(self, value_ranges: list) -> str:
+        values = [i.get("values", []) for i in value_ranges]
+        return hashlib.sha1(json.dumps(values).encode("utf-8")).hexdigest()
+
+    def save_mirror(self):
+        """
+        Stores the logbook state in the mirror, unless there are rows which
+        were not saved to the spreadsheet.
+        """
+        if self.mirror is None:
+            return
+        if (
+            self.flight_log_glider_to_add
+            or self.flight_log_glider_to_replace
+            or self.flight_log_glider_to_delete
+            or self.aircraft_models_to_add
+        ):
+            return
+        value_ranges = self.document.values_batch_get(
+            self._get_sentinel_ranges(
+                self.flight_log_glider_to_add_row_index, len(self.aircraft_models)
+            )
+        )["valueRanges"]
+        self.mirror.save(
+            self.spreadsheet_key,
+            self._get_checksum(value_ranges),
+            {
+                "aircraft_models": self.aircraft_models,
+                "date_format": self.date_format,
+                "sort_direction": self.sort_direction,
+                "flight_log_ids": sorted(self.flight_log_ids),
+                "next_row_index": self.flight_log_glider_to_add_row_index,
+            },
+        )
+
     def _parse_formula(self, value: str, row_index: int):
         if isinstance(value, str):
             return value.replace("{row_index}", str(row_index))
         return value
 
-    def _make_flight_log_id(self, data: list) -> str:
-        d = normalize_flight_date(data[0])
-        start_time = normalize_flight_time(data[6])
-        lend_time = normalize_flight_time(data[8])
-        result = f"{d}{data[5]}{start_time}{data[7]}{lend_time}"
-        return result
-    
     def get_parsed_flight_log_glider_to_add(self, row_index: int):
         result = []
         for row in self.flight_log_glider_to_add:
@@ -112,20 +191,6 @@ class PilotLogBook:
         return result
             
 
-    def add_aircraft_model(self, model: str, registration: str) -> bool:
-        exist_registration_list = [i[1].lower() for i in self.aircraft_models] + [
-            i[1].lower() for i in self.aircraft_models_to_add
-        ]
-        if registration.lower() not in exist_registration_list:
-            row_index = len(self.aircraft_models) + 1
-            self.aircraft_models_to_add_row_index = (
-                self.aircraft_models_to_add_row_index or row_index
-            )
-            # self.worksheet_aircraft_model.update(f"A{row_index}", [[model, registration]])
-            self.aircraft_models_to_add.append([model, registration])
-            return True
-        return False
-
     def save_aircraft_model(self):
         if self.aircraft_models_to_add:
             row_index = self.aircraft_models_to_add_row_index
@@ -134,72 +199,68 @@ class PilotLogBook:
                 self.aircraft_models_to_add,
                 value_input_option="USER_ENTERED",
             )
+            self.aircraft_models += self.aircraft_models_to_add
             self.aircraft_models_to_add = []
+            self.aircraft_models_to_add_row_index = None
 
-    def add_flight_log_glider(
-        self,
-        d: pd.Timestamp,
-        departure_place: str,
-        departure_time: str,
-        arrival_place: str,
-        arrival_time: str,
-        glider_model: str,
-        glider_registration: str,
-        type_of_launch: str,
-        landings: int,
-        name_p1: str,
-        name_p2: str,
-    ) -> bool:
-        row_index = self.flight_log_glider_to_add_row_index + len(
-            self.flight_log_glider_to_add
+    def _save_changed_flight_log_glider(self):
+        if not self.flight_log_glider_to_replace and not self.flight_log_glider_to_delete:
+            return
+        # Rows may have moved since the logbook was read, so look them up again
+        row_indexes = {}
+        rows = self.worksheet_flight_log_glider.get_values(
+            f"A1:I{self.flight_log_glider_to_add_row_index}"
         )
-        is_instructor = False
-        if (
-            self.instructor_from_date is not None
-            and d >= pd.Timestamp(self.instructor_from_date)
-        ):
-            is_instructor = self.is_instructor
-        if is_instructor is True and not name_p2:
-            is_instructor = False
-        if is_instructor is True and name_p2 == self.pilot_name:
-            is_instructor = False
+        for row_index, row in enumerate(rows, start=1):
+            if row and row[0]:
+                row = row + [""] * (9 - len(row))
+                row_indexes.setdefault(self._make_flight_log_id(row), row_index)
+        data = []
+        for old_flight_log_id, row in self.flight_log_glider_to_replace:
+            row_index = row_indexes.get(old_flight_log_id)
+            if row_index is None:
+                # The old row is not in the logbook anymore, add it as a new one
+                self.flight_log_glider_to_add.append(row)
+                continue
+            data.append(
+                {
+                    "range": f"A{row_index}:P{row_index}",
+                    "values": [[self._parse_formula(i, row_index) for i in row]],
+                }
+            )
+        if data:
+            self.worksheet_flight_log_glider.batch_update(
+                data, value_input_option="USER_ENTERED"
+            )
+        self.flight_log_glider_to_replace = []
 
-        # Date (yyyy-mm-dd)	
-        # Name PIC	
-        # Name P2	Glider		
-        # Departure		
-        # Arrival		
-        # Total time of flight	
-        # Type of launch	
-        # Landings	
-        # Instructor
-        data = [
-            normalize_date(d, self.date_format),
-            name_p1,
-            name_p2,
-            # self._get_formula("glider_model", row_index),
-            glider_model,
-            glider_registration,
-            departure_place,
-            departure_time,
-            arrival_place,
-            arrival_time,
-            self._get_formula("total_time_flights"),
-            type_of_launch,
-            landings,
-            is_instructor,
-            self._get_formula("pic_time"),
-            self._get_formula("dual_time"),
-            self._get_formula("instructor_time"),
-        ]
-        flight_log_id = self._make_flight_log_id(data)
-        if flight_log_id not in self.flight_log_id_list:
-            self.flight_log_glider_to_add.append(data)
-            self.flight_log_id_list.append(flight_log_id)
-            return True
-        return False
+        deleted_row_indexes = {
+            row_indexes[i] for i in self.flight_log_glider_to_delete if i in row_indexes
+        }
+        if deleted_row_indexes:
+            # Bottom rows first, so the indexes of the other ones don't move
+            self.document.batch_update(
+                {
+                    "requests": [
+                        {
+                            "deleteDimension": {
+                                "range": {
+                                    "sheetId": self.worksheet_flight_log_glider.id,
+                                    "dimension": "ROWS",
+                                    "startIndex": row_index - 1,
+                                    "endIndex": row_index,
+                                }
+                            }
+                        }
+                        for row_index in sorted(deleted_row_indexes, reverse=True)
+                    ]
+                }
+            )
+            self.flight_log_glider_to_add_row_index -= len(deleted_row_indexes)
+        self.flight_log_glider_to_delete = []
 
     def save_flight_log_glider(self):
+        self._save_changed_flight_log_glider()
         if len(self.flight_log_glider_to_add) > 0:
             current_rows = self.worksheet_flight_log_glider.row_count
             # At this point, we need to decide whether to append new rows to the end of the table or 
@@ -224,8 +285,23 @@ class PilotLogBook:
                 value_input_option="USER_ENTERED",
                 # value_input_option="RAW",
             )
+            # Rows are either appended or inserted above the existing ones, in both
+            # cases the first empty row moves down by the number of saved rows.
+            self.flight_log_glider_to_add_row_index += len(self.flight_log_glider_to_add)
             self.flight_log_glider_to_add = []
 
+    def finalize(self):
+        self.save_mirror()
+        self.update_filters()
+        self.update_tick_boxes()
+        self.update_cell_formating()
+
+    @property
+    def service(self):
+        if self._service is None:
+            self._service = build('sheets', 'v4', credentials=self.credentials)
+        return self._service
+
     def update_filters(self):
         rows_count = self.worksheet_flight_log_glider.row_count + len(self.flight_log_glider_to_add)
         requests = [
@@ -245,8 +321,7 @@ class PilotLogBook:
         ]
 
         body = {"requests": requests}
-        service = build('sheets', 'v4', credentials=self.credentials)
-        response = service.spreadsheets().batchUpdate(
+        response = self.service.spreadsheets().batchUpdate(
             spreadsheetId=self.spreadsheet_key,
             body=body
         ).execute()
@@ -278,8 +353,7 @@ class PilotLogBook:
         body = {
             'requests': requests
         }
-        service = build('sheets', 'v4', credentials=self.credentials)
-        response = service.spreadsheets().batchUpdate(
+        response = self.service.spreadsheets().batchUpdate(
             spreadsheetId=self.spreadsheet_key,
             body=body
         ).execute()
@@ -0,0 +1,195 @@
+from abc import ABC, abstractmethod
+from datetime import date
+from typing import Optional
+import pandas as pd
+from app.flights.schemas import FlightSchema
+from app.helpers import (
+    DEFAULT_DATE_FORMAT,
+    get_sort_direction,
+    normalize_date,
+    normalize_flight_date,
+    normalize_flight_time,
+)
+
+
+class BaseLogBook(ABC):
+    """
+    Logbook logic shared by all storage backends: de-duplication of flights and
+    aircraft models, the instructor flag and the layout of a flight log row.
+
+    A backend reads its existing rows into `aircraft_models`, `registrations`,
+    `flight_log_glider` and `flight_log_ids` (and detects `date_format` and
+    `sort_direction` from them), and implements `save_aircraft_model`,
+    `save_flight_log_glider` and, if needed, `finalize`.
+    """
+
+    def __init__(
+        self,
+        pilot_name: Optional[str],
+        is_instructor: bool = False,
+        instructor_from_date: Optional[date] = None,
+    ):
+        self.pilot_name = pilot_name
+        self.is_instructor = is_instructor
+        self.instructor_from_date = instructor_from_date
+
+        self.aircraft_models = []
+        self.registrations = set()
+        self.aircraft_models_to_add = []
+        self.aircraft_models_to_add_row_index = None
+
+        self.flight_log_glider = []
+        self.date_format = DEFAULT_DATE_FORMAT
+        self.sort_direction = get_sort_direction([])
+        self.flight_log_ids = set()
+        self.flight_log_glider_to_add = []
+        # (old flight log ID, new row) of flights edited after they were written
+        self.flight_log_glider_to_replace = []
+        # Flight log IDs of rows to delete, e.g. the pilot of the flight changed
+        self.flight_log_glider_to_delete = []
+
+    def _get_formula(self, key: str):
+        formula_dict = {
+            "glider_model": """=IF(G{row_index}="";"";XLOOKUP(G{row_index};'Aircraft model'!$B$1:$B$1000;'Aircraft model'!$A$1:$A$1000;""))""",
+            "total_time_flights": '=IF(G{row_index}>0;I{row_index}-G{row_index};"")',
+            # "pic_time": f"""=IF(K{row_index}='Summary Glider'!$B$1;E{row_index}-C{row_index};"")""",
+            # "dual_time": f"""=IF(K{row_index}='Summary Glider'!$B$1;"";IF(L{row_index}='Summary Glider'!$B$1;E{row_index}-C{row_index};""))""",
+            # "instructor_time": f"""=IF(M{row_index}=TRUE;E{row_index}-C{row_index};"")""",
+            "pic_time": """=IF(B{row_index}='Summary Glider'!$B$1,I{row_index}-G{row_index},"")""",
+            "dual_time": """=IF(B{row_index}='Summary Glider'!$B$1,"",IF(C{row_index}='Summary Glider'!$B$1,I{row_index}-G{row_index},""))""",
+            "instructor_time": """=IF(M{row_index}=TRUE,I{row_index}-G{row_index},"")""",
+        }
+        return formula_dict.get(key, "")
+
+    def _make_flight_log_id(self, data: list) -> str:
+        d = normalize_flight_date(data[0])
+        start_time = normalize_flight_time(data[6])
+        lend_time = normalize_flight_time(data[8])
+        result = f"{d}{data[5]}{start_time}{data[7]}{lend_time}"
+        return result
+
+    def add_aircraft_model(self, model: str, registration: str) -> bool:
+        if registration.lower() not in self.registrations:
+            row_index = len(self.aircraft_models) + 1
+            self.aircraft_models_to_add_row_index = (
+                self.aircraft_models_to_add_row_index or row_index
+            )
+            # self.worksheet_aircraft_model.update(f"A{row_index}", [[model, registration]])
+            self.aircraft_models_to_add.append([model, registration])
+            self.registrations.add(registration.lower())
+            return True
+        return False
+
+    def add_flight(self, flight: FlightSchema) -> bool:
+        """
+        Adds a flight prepared by FlightPreparationCache together with its
+        aircraft model. Only the date format and the instructor flag depend
+        on the logbook, the rest of the row is taken as prepared.
+        """
+        self.add_aircraft_model(flight.glider_model, flight.glider_registration)
+        flight_date = normalize_date(flight.date_flown, self.date_format)
+        flight_log_id = self._get_flight_log_id(flight, flight_date)
+        if flight_log_id in self.flight_log_ids:
+            return False
+        return self._add_flight_log_glider_row(
+            self._make_flight_row(flight, flight_date), flight_log_id
+        )
+
+    def replace_flight(self, old_flight: FlightSchema, flight: FlightSchema) -> bool:
+        """
+        Replaces the row of a flight that was edited in the database after it
+        had been written to the logbook (e.g. the land time was filled in).
+        If the old row is not in the logbook, the flight is added as a new one.
+        """
+        old_flight_date = normalize_date(old_flight.date_flown, self.date_format)
+        old_flight_log_id = self._get_flight_log_id(old_flight, old_flight_date)
+        if old_flight_log_id not in self.flight_log_ids:
+            return self.add_flight(flight)
+        self.add_aircraft_model(flight.glider_model, flight.glider_registration)
+        flight_date = normalize_date(flight.date_flown, self.date_format)
+        flight_log_id = self._get_flight_log_id(flight, flight_date)
+        if flight_log_id != old_flight_log_id and flight_log_id in self.flight_log_ids:
+            return False
+        data = self._make_flight_row(flight, flight_date)
+        if data == self._make_flight_row(old_flight, old_flight_date):
+            return False
+        self.flight_log_ids.discard(old_flight_log_id)
+        self.flight_log_ids.add(flight_log_id)
+        self.flight_log_glider_to_replace.append((old_flight_log_id, data))
+        return True
+
+    def remove_flight(self, old_flight: FlightSchema) -> bool:
+        """
+        Removes the row of a flight that is not in this logbook anymore,
+        e.g. because P2 was corrected in the database.
+        """
+        old_flight_date = normalize_date(old_flight.date_flown, self.date_format)
+        old_flight_log_id = self._get_flight_log_id(old_flight, old_flight_date)
+        if old_flight_log_id not in self.flight_log_ids:
+            return False
+        self.flight_log_ids.discard(old_flight_log_id)
+        self.flight_log_glider_to_delete.append(old_flight_log_id)
+        return True
+
+    def _get_flight_log_id(self, flight: FlightSchema, flight_date: str) -> str:
+        return f"{normalize_flight_date(flight_date)}{flight.flight_log_id_tail}"
+
+    def _make_flight_row(self, flight: FlightSchema, flight_date: str) -> list:
+        # Date (yyyy-mm-dd)
+        # Name PIC
+        # Name P2	Glider
+        # Departure
+        # Arrival
+        # Total time of flight
+        # Type of launch
+        # Landings
+        # Instructor
+        return [
+            flight_date,
+            flight.name_p1,
+            flight.name_p2,
+            flight.glider_model,
+            flight.glider_registration,
+            flight.departure_place,
+            flight.departure_time,
+            flight.arrival_place,
+            flight.arrival_time,
+            self._get_formula("total_time_flights"),
+            flight.type_of_launch,
+            flight.landings,
+            self._is_instructor_flight(flight.date_flown, flight.name_p2),
+            self._get_formula("pic_time"),
+            self._get_formula("dual_time"),
+            self._get_formula("instructor_time"),
+        ]
+
+    def _is_instructor_flight(self, d: pd.Timestamp, name_p2: str) -> bool:
+        is_instructor = False
+        if (
+            self.instructor_from_date is not None
+            and d >= pd.Timestamp(self.instructor_from_date)
+        ):
+            is_instructor = self.is_instructor
+        if is_instructor is True and not name_p2:
+            is_instructor = False
+        if is_instructor is True and name_p2 == self.pilot_name:
+            is_instructor = False
+        return is_instructor
+
+    def _add_flight_log_glider_row(self, data: list, flight_log_id: str) -> bool:
+        if flight_log_id not in self.flight_log_ids:
+            self.flight_log_glider_to_add.append(data)
+            self.flight_log_ids.add(flight_log_id)
+            return True
+        return False
+
+    @abstractmethod
+    def save_aircraft_model(self):
+        pass
+
+    @abstractmethod
+    def save_flight_log_glider(self):
+        pass
+
+    def finalize(self):
+        pass
@@ -0,0 +1,247 @@
+from datetime import date, datetime
+import csv
+import os
+import sqlite3
+from typing import List, Optional, Tuple
+from openpyxl import Workbook, load_workbook
+from app.flights.schemas import FlightSchema
+from app.helpers import (
+    SortDirection,
+    get_date_format,
+    get_sort_direction,
+)
+from app.pilot_logbook.base import BaseLogBook
+
+
+FILE_FORMATS = ["xlsx", "csv", "sqlite"]
+
+# (header, SQLite column) of the FlightLogGlider columns A:P
+LOGBOOK_COLUMNS = [
+    ("Date", "date"),
+    ("Name PIC", "name_pic"),
+    ("Name P2", "name_p2"),
+    ("Glider", "glider"),
+    ("Registration", "registration"),
+    ("Departure place", "departure_place"),
+    ("Departure time", "departure_time"),
+    ("Arrival place", "arrival_place"),
+    ("Arrival time", "arrival_time"),
+    ("Total time of flight", "total_time"),
+    ("Type of launch", "type_of_launch"),
+    ("Landings", "landings"),
+    ("Instructor", "instructor"),
+    ("PIC time", "pic_time"),
+    ("Dual time", "dual_time"),
+    ("Instructor time", "instructor_time"),
+]
+AIRCRAFT_MODEL_COLUMNS = [
+    ("Model", "model"),
+    ("Registration", "registration"),
+]
+
+
+class LocalLogBook(BaseLogBook):
+    """
+    Logbook kept in a local file instead of a Google spreadsheet. The format is
+    taken from the file extension (.xlsx, .csv or .sqlite); a CSV logbook keeps
+    its aircraft models in a second "<name> - Aircraft model.csv" file.
+
+    Nothing is written until `finalize`, which rewrites the whole file once
+    with streaming writers.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        pilot_name: str,
+        is_instructor: bool = False,
+        instructor_from_date: Optional[date] = None,
+    ):
+        super().__init__(pilot_name, is_instructor, instructor_from_date)
+        self.filename = filename
+        self.file_format = os.path.splitext(filename)[1].lower().lstrip(".")
+        if self.file_format not in FILE_FORMATS:
+            raise ValueError(f"Unsupported logbook file format: {filename}")
+        self.changed = False
+
+        self.aircraft_models, self.flight_log_glider = self._read()
+        self.registrations = {str(i[1]).lower() for i in self.aircraft_models}
+        self.date_format = get_date_format([i[0] for i in self.flight_log_glider[:10]])
+        self.sort_direction = get_sort_direction(self.flight_log_glider)
+        self.flight_log_ids = {
+            self._make_flight_log_id(i) for i in self.flight_log_glider
+        }
+
+    @property
+    def aircraft_model_filename(self) -> str:
+        return f"{os.path.splitext(self.filename)[0]} - Aircraft model.csv"
+
+    def _get_formula(self, key: str):
+        # Sheets formulas can't be used outside Google Sheets,
+        # the values are calculated in _make_flight_row
+        return ""
+
+    def _get_duration(self, departure_time: str, arrival_time: str) -> str:
+        if not departure_time or not arrival_time:
+            return ""
+        start = datetime.strptime(departure_time, "%H:%M")
+        end = datetime.strptime(arrival_time, "%H:%M")
+        minutes = int((end - start).total_seconds() // 60)
+        if minutes < 0:
+            return ""
+        return f"{minutes // 60}:{minutes % 60:02d}"
+
+    def _make_flight_row(self, flight: FlightSchema, flight_date: str) -> list:
+        data = super()._make_flight_row(flight, flight_date)
+        total_time = self._get_duration(data[6], data[8])
+        data[9] = total_time
+        data[13] = total_time if data[1] == self.pilot_name else ""
+        data[14] = (
+            total_time if data[1] != self.pilot_name and data[2] == self.pilot_name else ""
+        )
+        data[15] = total_time if data[12] is True else ""
+        return data
+
+    def save_aircraft_model(self):
+        if self.aircraft_models_to_add:
+            self.aircraft_models += self.aircraft_models_to_add
+            self.aircraft_models_to_add = []
+            self.aircraft_models_to_add_row_index = None
+            self.changed = True
+
+    def save_flight_log_glider(self):
+        if self.flight_log_glider_to_delete:
+            deleted_ids = list(self.flight_log_glider_to_delete)
+            flight_log_glider = []
+            for row in self.flight_log_glider:
+                flight_log_id = self._make_flight_log_id(row)
+                if flight_log_id in deleted_ids:
+                    deleted_ids.remove(flight_log_id)
+                else:
+                    flight_log_glider.append(row)
+            self.flight_log_glider = flight_log_glider
+            self.flight_log_glider_to_delete = []
+            self.changed = True
+        if self.flight_log_glider_to_replace:
+            replaced_rows = dict(self.flight_log_glider_to_replace)
+            self.flight_log_glider = [
+                replaced_rows.pop(self._make_flight_log_id(row), row)
+                for row in self.flight_log_glider
+            ]
+            # Rows that are not in the file anymore are added as new ones
+            self.flight_log_glider_to_add += list(replaced_rows.values())
+            self.flight_log_glider_to_replace = []
+            self.changed = True
+        if self.flight_log_glider_to_add:
+            if self.sort_direction == SortDirection.NEWEST_LAST:
+                self.flight_log_glider = self.flight_log_glider + self.flight_log_glider_to_add
+            else:
+                self.flight_log_glider = self.flight_log_glider_to_add + self.flight_log_glider
+            self.flight_log_glider_to_add = []
+            self.changed = True
+
+    def finalize(self):
+        if not self.changed:
+            return
+        if self.file_format == "xlsx":
+            self._write_xlsx()
+        elif self.file_format == "csv":
+            self._write_csv(self.filename, LOGBOOK_COLUMNS, self.flight_log_glider)
+            self._write_csv(
+                self.aircraft_model_filename, AIRCRAFT_MODEL_COLUMNS, self.aircraft_models
+            )
+        else:
+            self._write_sqlite()
+        self.changed = False
+
+    def _read(self) -> Tuple[List[list], List[list]]:
+        if not os.path.exists(self.filename):
+            return [], []
+        if self.file_format == "xlsx":
+            return self._read_xlsx()
+        if self.file_format == "csv":
+            return (
+                self._read_csv(self.aircraft_model_filename),
+                self._read_csv(self.filename),
+            )
+        return self._read_sqlite()
+
+    def _make_row(self, values) -> list:
+        return ["" if i is None else i for i in values]
+
+    def _read_xlsx(self):
+        wb = load_workbook(self.filename, read_only=True, data_only=True)
+        aircraft_models = [
+            self._make_row(i)
+            for i in wb["Aircraft model"].iter_rows(min_row=2, values_only=True)
+        ]
+        flight_log_glider = [
+            self._make_row(i)
+            for i in wb["FlightLogGlider"].iter_rows(min_row=2, values_only=True)
+            if i[0]
+        ]
+        wb.close()
+        return aircraft_models, flight_log_glider
+
+    def _write_xlsx(self):
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("FlightLogGlider")
+        ws.append([i[0] for i in LOGBOOK_COLUMNS])
+        for row in self.flight_log_glider:
+            ws.append(row)
+        ws = wb.create_sheet("Aircraft model")
+        ws.append([i[0] for i in AIRCRAFT_MODEL_COLUMNS])
+        for row in self.aircraft_models:
+            ws.append(row)
+        wb.save(self.filename)
+
+    def _read_csv(self, filename: str) -> List[list]:
+        if not os.path.exists(filename):
+            return []
+        with open(filename, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            return [row for row in reader if row and row[0]]
+
+    def _write_csv(self, filename: str, columns: list, rows: List[list]):
+        with open(filename, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow([i[0] for i in columns])
+            writer.writerows(rows)
+
+    def _read_sqlite(self):
+        conn = sqlite3.connect(self.filename)
+        try:
+            aircraft_models = [
+                self._make_row(i)
+                for i in conn.execute("SELECT * FROM aircraft_model ORDER BY rowid")
+            ]
+            flight_log_glider = [
+                self._make_row(i)
+                for i in conn.execute("SELECT * FROM flight_log_glider ORDER BY rowid")
+            ]
+        finally:
+            conn.close()
+        return aircraft_models, flight_log_glider
+
+    def _write_sqlite(self):
+        conn = sqlite3.connect(self.filename)
+        try:
+            with conn:
+                self._replace_sqlite_table(
+                    conn, "flight_log_glider", LOGBOOK_COLUMNS, self.flight_log_glider
+                )
+                self._replace_sqlite_table(
+                    conn, "aircraft_model", AIRCRAFT_MODEL_COLUMNS, self.aircraft_models
+                )
+        finally:
+            conn.close()
+
+    def _replace_sqlite_table(self, conn, table_name: str, columns: list, rows: List[list]):
+        column_names = [i[1] for i in columns]
+        conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+        conn.execute(f"CREATE TABLE {table_name} ({', '.join(column_names)})")
+        conn.executemany(
+            f"INSERT INTO {table_name} VALUES ({', '.join('?' * len(column_names))})",
+            (row[:len(column_names)] for row in rows),
+        )
@@ -0,0 +1,66 @@
+import json
+import sqlite3
+from typing import Optional
+
+
+class LogbookMirror:
+    """
+    Local SQLite cache of what the sync needs from each logbook spreadsheet:
+    flight log IDs, aircraft models, date format, sort direction and the next
+    free row of FlightLogGlider.
+
+    An entry is stored together with a checksum of a few sentinel ranges of
+    the spreadsheet (the first and last flight rows, the row after them and
+    the last aircraft models). Appending, inserting or deleting rows changes
+    them, so a logbook edited by hand is read in full again. Edits that only
+    change a cell in the middle of the logbook are not detected.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        conn = sqlite3.connect(self.filename)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS logbooks ("
+                    "spreadsheet_key TEXT PRIMARY KEY, checksum TEXT, state TEXT)"
+                )
+        finally:
+            conn.close()
+
+    def get(self, spreadsheet_key: str) -> Optional[dict]:
+        conn = sqlite3.connect(self.filename)
+        try:
+            row = conn.execute(
+                "SELECT checksum, state FROM logbooks WHERE spreadsheet_key = ?",
+                (spreadsheet_key,),
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        state = json.loads(row[1])
+        state["checksum"] = row[0]
+        return state
+
+    def save(self, spreadsheet_key: str, checksum: str, state: dict):
+        conn = sqlite3.connect(self.filename)
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO logbooks (spreadsheet_key, checksum, state) "
+                    "VALUES (?, ?, ?)",
+                    (spreadsheet_key, checksum, json.dumps(state)),
+                )
+        finally:
+            conn.close()
+
+    def delete(self, spreadsheet_key: str):
+        conn = sqlite3.connect(self.filename)
+        try:
+            with conn:
+                conn.execute(
+                    "DELETE FROM logbooks WHERE spreadsheet_key = ?", (spreadsheet_key,)
+                )
+        finally:
+            conn.close()
@@ -0,0 +1,249 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set
+import gspread
+from googleapiclient.discovery import build
+from tqdm import tqdm
+
+from app.club_members import ClubMembers
+from app.club_members.schemas import ClubMemberSchema
+from app.databases import FLIGHT_TIME_TABLE, LOOKUP_TABLES, FlightDatabase
+from app.databases.schemas import DatabaseSchema
+from app.db import read_tables
+from app.flights import sort_flights
+from app.flights.schemas import FlightSchema
+from app.helpers import SortDirection
+from app.pilot_logbook import PilotLogBook
+from app.pilot_logbook.base import BaseLogBook
+from app.pilot_logbook.mirror import LogbookMirror
+
+
+def add_flights(
+    logbook: BaseLogBook,
+    flights: List[FlightSchema],
+    replaced_flights: Optional[Dict[tuple, FlightSchema]] = None,
+) -> int:
+    """
+    Adds flights to the logbook in its sort direction and returns how many
+    rows were added, replaced or removed. `replaced_flights` maps (source,
+    AutoID) of flights edited in the database to their previous version;
+    the rows of those which are not among `flights` anymore are removed.
+    """
+    replaced_flights = replaced_flights or {}
+    count = 0
+    flight_keys = {(i.source, i.auto_id) for i in flights}
+    for key, old_flight in replaced_flights.items():
+        if key not in flight_keys and logbook.remove_flight(old_flight) is True:
+            count += 1
+    for flight in sort_flights(flights, logbook.sort_direction):
+        old_flight = replaced_flights.get((flight.source, flight.auto_id))
+        if old_flight is not None:
+            added = logbook.replace_flight(old_flight, flight)
+        else:
+            added = logbook.add_flight(flight)
+        if added is True:
+            count += 1
+    return count
+
+
+class LogbookSync:
+    def __init__(
+        self,
+        credentials,
+        club_members: ClubMembers,
+        databases: List[DatabaseSchema],
+        keep_logbooks_open: bool = False,
+        mirror: Optional[LogbookMirror] = None,
+    ):
+        self.credentials = credentials
+        # The Sheets clients are shared by all logbooks and kept between watch
+        # cycles. Credentials are not needed when logbooks are only exported.
+        self.gc = None
+        self.service = None
+        if credentials is not None:
+            self.gc = gspread.authorize(credentials)
+            self.service = build('sheets', 'v4', credentials=credentials)
+        self.club_members = club_members
+        # In watch mode opened logbooks are reused and only refreshed, which
+        # with the mirror costs one read of the sentinel ranges per sync.
+        self.keep_logbooks_open = keep_logbooks_open
+        self.logbooks: Dict[str, PilotLogBook] = {}
+        self.mirror = mirror
+        # Members whose last sync failed, they are retried in the next cycle
+        self.pending_member_ids: Set[int] = set()
+        # club ID -> {(source, AutoID): previous version} of edited flights
+        self.replaced_flights: Dict[int, Dict[tuple, FlightSchema]] = {}
+        self.flight_databases = [FlightDatabase(i) for i in databases]
+        for flight_database in self.flight_databases:
+            flight_database.set_members(club_members.members)
+
+    def _read_tables(
+        self, flight_databases: List[FlightDatabase], table_names: List[str]
+    ) -> List[Dict[str, dict]]:
+        if len(flight_databases) == 1:
+            return [read_tables(table_names, flight_databases[0].path)]
+        # Every database is read in its own process
+        with ProcessPoolExecutor(max_workers=len(flight_databases)) as executor:
+            return list(
+                executor.map(
+                    read_tables,
+                    [table_names] * len(flight_databases),
+                    [i.path for i in flight_databases],
+                )
+            )
+
+    def load_tables(self):
+        all_tables = self._read_tables(
+            self.flight_databases, [FLIGHT_TIME_TABLE] + LOOKUP_TABLES
+        )
+        for flight_database, tables in zip(self.flight_databases, all_tables):
+            flight_database.set_lookup_tables(tables)
+            flight_database.set_flight_time(
+                flight_database.make_flight_time(tables[FLIGHT_TIME_TABLE])
+            )
+        self.replaced_flights = {}
+
+    def reload_tables(self, paths: Optional[List[str]] = None) -> Set[int]:
+        """
+        Re-reads tblFlightTime of the databases in `paths` (all by default) and
+        returns club IDs of members whose flights were added or changed since
+        the previous read, including former pilots of flights whose P1 / P2
+        was changed. Lookup tables are only re-read when a changed flight
+        references a glider or member we don't know.
+
+        All tables are read before anything is stored, so if a read fails the
+        same changes are found again on the next call. The returned members
+        are also kept pending until they are synced.
+        """
+        flight_databases = [
+            i for i in self.flight_databases if paths is None or i.path in paths
+        ]
+        if not flight_databases:
+            return set()
+        all_tables = self._read_tables(flight_databases, [FLIGHT_TIME_TABLE])
+        updates = []
+        for flight_database, tables in zip(flight_databases, all_tables):
+            df_flight_time = flight_database.make_flight_time(tables[FLIGHT_TIME_TABLE])
+            snapshot = flight_database.make_snapshot(df_flight_time)
+            changed_flights = flight_database.get_changed_flights(df_flight_time, snapshot)
+            lookup_tables = None
+            if flight_database.has_unknown_references(changed_flights):
+                lookup_tables = read_tables(LOOKUP_TABLES, flight_database.path)
+            updates.append((flight_database, df_flight_time, snapshot, lookup_tables))
+
+        member_ids = set()
+        for flight_database, df_flight_time, snapshot, lookup_tables in updates:
+            # Old versions are prepared before the lookup tables are replaced
+            changed_flights, old_flights = flight_database.set_flight_time(
+                df_flight_time, snapshot
+            )
+            if lookup_tables is not None:
+                flight_database.set_lookup_tables(lookup_tables)
+            for old_flight in old_flights:
+                for pilot in (old_flight.p1, old_flight.p2):
+                    pilot = flight_database.get_club_id(pilot)
+                    if pilot is None:
+                        continue
+                    # Keep the version that is in the logbook if the flight
+                    # was edited again before it was synced
+                    self.replaced_flights.setdefault(pilot, {}).setdefault(
+                        (old_flight.source, old_flight.auto_id), old_flight
+                    )
+                    member_ids.add(pilot)
+            member_ids |= flight_database.get_member_ids(changed_flights)
+        self.pending_member_ids |= member_ids
+        return member_ids
+
+    def get_logbook(self, member: ClubMemberSchema) -> PilotLogBook:
+        # Logbooks are validated again on every sync, so rows added or deleted
+        # by hand in the meantime are taken into account
+        logbook = self.logbooks.get(member.spreadsheet_key)
+        if logbook is not None:
+            logbook.refresh()
+            return logbook
+        logbook = PilotLogBook(
+            self.credentials,
+            member.spreadsheet_key,
+            gc=self.gc,
+            mirror=self.mirror,
+            service=self.service,
+        )
+        if self.keep_logbooks_open:
+            self.logbooks[member.spreadsheet_key] = logbook
+        return logbook
+
+    def sync_members(self, members: Iterable[ClubMemberSchema], force: bool = False):
+        """
+        With `force` the Sync Count check is skipped, which is needed for members
+        whose flights were edited or who are retried after an error.
+        """
+        members = list(members)
+        pbar = tqdm(members, total=len(members))
+        for member in pbar:
+            pbar.set_description(f"Sync Logbook for {member.name}")
+            try:
+                self.sync_member(member, force=force)
+            except Exception as e:
+                tqdm.write(f"Error sync logbook for {member.name} - {e}")
+                self.pending_member_ids.add(member.club_id)
+
+    def get_member_name(self, member: ClubMemberSchema) -> str:
+        """
+        Name of the member as written in tblMember, which is what the flights
+        use for Name PIC / Name P2. Members.xlsx name is only a fallback.
+        """
+        for flight_database in self.flight_databases:
+            name = flight_database.get_member_name(member.club_id)
+            if name:
+                return name
+        return member.name
+
+    def get_member_flights(self, member: ClubMemberSchema) -> List[FlightSchema]:
+        """
+        Flights of the member from all databases merged into one stream,
+        oldest first.
+        """
+        flights = []
+        for flight_database in self.flight_databases:
+            flights += flight_database.get_member_flights(member.club_id)
+        return sort_flights(flights, SortDirection.NEWEST_LAST)
+
+    def sync_member(self, member: ClubMemberSchema, force: bool = False) -> int:
+        flights = self.get_member_flights(member)
+        rows_count = len(flights)
+        if not force and member.sync_count >= rows_count:
+            return 0
+        pilog_log_book = self.get_logbook(member)
+        count = add_flights(
+            pilog_log_book, flights, self.replaced_flights.get(member.club_id)
+        )
+        tqdm.write(f"Added {count} rows for {member.name}")
+        if count > 0:
+            tqdm.write(
+                f"Save {count} flight log and aircraft models for {member.name} - processing..."
+            )
+            try:
+                pilog_log_book.save_aircraft_model()
+                pilog_log_book.save_flight_log_glider()
+                tqdm.write(
+                    f"Save {count} flight log and aircraft models for {member.name} - saved"
+                )
+                tqdm.write(f"Sync count for {member.name} has been updated to {rows_count}")
+            except Exception as e:
+                tqdm.write(
+                    f"Save {count} flight log and aircraft models for {member.name} - error ({e})"
+                )
+                # The spreadsheet may be partly written, read it in full next time
+                if self.mirror is not None:
+                    self.mirror.delete(member.spreadsheet_key)
+                self.pending_member_ids.add(member.club_id)
+                return 0
+            try:
+                pilog_log_book.finalize()
+            except Exception as e:
+                tqdm.write(f"Error update filters and cell formating for {member.name} - {e}")
+        self.pending_member_ids.discard(member.club_id)
+        self.replaced_flights.pop(member.club_id, None)
+        if member.sync_count != rows_count:
+            member.sync_count = rows_count
+            self.club_members.save()
+        return count
@@ -0,0 +1,82 @@
+import os
+import platform
+import time
+from typing import List, Optional, Set
+
+
+class DatabaseWatcher:
+    """
+    Blocks until one of the watched database files has changed and then stayed
+    quiet for `debounce` seconds, so a burst of writes from Access results in a
+    single sync cycle.
+
+    On Linux inotify is used when the optional `inotify_simple` package is
+    installed, otherwise the files' mtime and size are polled.
+    """
+
+    def __init__(self, paths: List[str], poll_interval: float = 2.0, debounce: float = 5.0):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._signature = self._get_signature()
+        self._inotify = self._make_inotify()
+
+    def _make_inotify(self):
+        if platform.system() != "Linux":
+            return None
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            return None
+        inotify = INotify()
+        watch_flags = flags.MODIFY | flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE
+        # Watch the directories rather than the files themselves: the file may be
+        # replaced on save, which would silently drop a file watch.
+        self._directories = {}
+        for directory in {os.path.dirname(path) for path in self.paths}:
+            self._directories[inotify.add_watch(directory, watch_flags)] = directory
+        return inotify
+
+    def _get_signature(self) -> tuple:
+        signature = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _changed(self, timeout: float) -> Set[str]:
+        if self._inotify is not None:
+            events = self._inotify.read(timeout=int(timeout * 1000))
+            event_paths = {
+                os.path.join(self._directories[event.wd], event.name) for event in events
+            }
+            return {path for path in self.paths if path in event_paths}
+        time.sleep(timeout)
+        signature = self._get_signature()
+        changed = {
+            path
+            for path, old, new in zip(self.paths, self._signature, signature)
+            if old != new
+        }
+        self._signature = signature
+        return changed
+
+    def wait_for_change(self, timeout: Optional[float] = None) -> Set[str]:
+        """
+        Returns the paths of the databases that have changed, or an empty set
+        if nothing changed within `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed = set()
+        while not changed:
+            if deadline is not None and time.monotonic() >= deadline:
+                return changed
+            changed = self._changed(self.poll_interval)
+        while True:
+            more_changed = self._changed(self.debounce)
+            if not more_changed:
+                return changed
+            changed |= more_changed
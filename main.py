@@ -1,144 +1,148 @@
-from tqdm import tqdm
-
-import pandas as pd
+import argparse
+import multiprocessing
+import time
 
 from app.club_members import ClubMembers
-from app.db import read_table
-from app.pilot_logbook import PilotLogBook
-import gspread
+from app.databases import load_databases
+from app.export import export_logbooks
+from app.pilot_logbook.local import FILE_FORMATS
+from app.pilot_logbook.mirror import LogbookMirror
+from app.sync import LogbookSync
+from app.watcher import DatabaseWatcher
 from google.oauth2.service_account import Credentials
-from app.helpers import (
-    SortDirection,
-    normalize_date,
-    normalize_time,
-)
 from dotenv import load_dotenv
 import os
 
 
 load_dotenv()
 
-PLACE_NAME = os.getenv("PLACE_NAME")
-DATABASE_PATH = os.getenv("DATABASE_PATH")
-DEFAULT_LAUNCH_TYPE = os.getenv("DEFAULT_LAUNCH_TYPE")
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", 2))
+WATCH_DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", 5))
+WATCH_RETRY_SECONDS = float(os.getenv("WATCH_RETRY_SECONDS", 60))
+LOGBOOK_CACHE_PATH = os.getenv("LOGBOOK_CACHE_PATH", "logbook_cache.sqlite")
 
 SERVICE_ACCOUNT_FILE = "keys.json"
 
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
-credentials = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-
-print("Load members from Members.xlsx")
-club_members = ClubMembers("Members.xlsx")
-print("Loaded members", len(club_members.members))
-print(f"Load database from {DATABASE_PATH}...")
-
-# print("Reading tables")
-# table_flight_time_dict = db.parse_table("tblFlightTime")
-# table_glider_daetails_dict = db.parse_table("tblGliderDetails")
-# table_glider_type_dict = db.parse_table("TblGliderType")
-# table_member_dict = db.parse_table("tblMember")
-
-# glider_daetails_dict = dict(
-#     zip(table_glider_daetails_dict["AutoID"], table_glider_daetails_dict["GliderID"])
-# )
-# glider_dict = dict(
-#     zip(table_glider_type_dict["TypeId"], table_glider_type_dict["GliderType"])
-# )
-# member_dict = dict(zip(table_member_dict["MemberID"], table_member_dict["Name"]))
-
-# df_flight_time = pd.DataFrame(table_flight_time_dict)
-
-print("Reading tables")
-table_flight_time_dict = read_table("tblFlightTime")
-table_glider_daetails_dict = read_table("tblGliderDetails")
-table_glider_type_dict = read_table("TblGliderType")
-table_member_dict = read_table("tblMember")
-
-glider_daetails_dict = dict(
-    zip(table_glider_daetails_dict["AutoID"], table_glider_daetails_dict["GliderID"])
-)
-glider_dict = dict(
-    zip(table_glider_type_dict["TypeId"], table_glider_type_dict["GliderType"])
-)
-member_dict = dict(zip(table_member_dict["MemberID"], table_member_dict["Name"]))
-df_flight_time = pd.DataFrame(table_flight_time_dict)
-
-
-df_flight_time["DateFlown"] = pd.to_datetime(
-    df_flight_time["DateFlown"], errors="coerce"
-)
-
-pbar = tqdm(club_members.members, total=len(club_members.members))
-for member in pbar:
-    pbar.set_description(f"Sync Logbook for {member.name}")
-    pilot_flights = df_flight_time[
-        (df_flight_time["P1"] == member.club_id)
-        | (df_flight_time["P2"] == member.club_id)
-    ]
-    rows_count = len(pilot_flights)
-    if member.sync_count >= len(pilot_flights):
-        break
-    pilog_log_book = PilotLogBook(credentials, member.spreadsheet_key)
-    # Sorting by DateFlown, LaunchTime, LandTime
-    if pilog_log_book.sort_direction == SortDirection.NEWEST_LAST:
-        pilot_flights = pilot_flights.sort_values(
-            by=["DateFlown", "LaunchTime", "LandTime"], ascending=[True, True, True]
-        )
-    else:
-        pilot_flights = pilot_flights.sort_values(
-            by=["DateFlown", "LaunchTime", "LandTime"], ascending=[False, False, False]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sync club flights to pilots' logbooks")
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and sync as soon as the database changes",
+    )
+    parser.add_argument(
+        "--export",
+        metavar="DIR",
+        help="write all members' logbooks to local files in DIR instead of Google Sheets",
+    )
+    parser.add_argument(
+        "--export-format",
+        choices=FILE_FORMATS,
+        default="xlsx",
+        help="file format of exported logbooks (default: xlsx)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="read every logbook in full instead of using the local logbook cache",
+    )
+    return parser.parse_args()
+
+
+def watch(watcher: DatabaseWatcher, logbook_sync: LogbookSync, club_members: ClubMembers):
+    print(f"Watching {', '.join(watcher.paths)} for changes (Ctrl+C to stop)...")
+    pending = set()
+    try:
+        while True:
+            if pending:
+                time.sleep(WATCH_POLL_INTERVAL)
+                changed = pending
+            elif logbook_sync.pending_member_ids:
+                # Members that failed to sync are retried even if nothing changed
+                changed = watcher.wait_for_change(timeout=WATCH_RETRY_SECONDS)
+            else:
+                changed = watcher.wait_for_change()
+            try:
+                member_ids = logbook_sync.reload_tables(changed)
+                pending = set()
+            except Exception as e:
+                # Access may still hold a lock on the file, try again shortly
+                print(f"Error reading database - {e}")
+                pending = changed
+                continue
+            member_ids |= logbook_sync.pending_member_ids
+            members = [m for m in club_members.members if m.club_id in member_ids]
+            if members:
+                print(f"Database changed, sync {len(members)} members")
+                # Changed flights may not change the number of member's flights
+                logbook_sync.sync_members(members, force=True)
+    except KeyboardInterrupt:
+        print("Watch mode stopped.")
+
+
+def main():
+    args = parse_args()
+    if args.watch and args.export:
+        raise SystemExit("--watch can't be used together with --export")
+
+    credentials = None
+    if not args.export:
+        credentials = Credentials.from_service_account_file(
+            SERVICE_ACCOUNT_FILE, scopes=SCOPES
         )
-    count = 0
-    for _, row in pilot_flights.iterrows():
-    # for _, row in tqdm(pilot_flights.iterrows(), total=len(pilot_flights), desc=f"Sync {member.name}"):
-        glider_registration = glider_daetails_dict.get(row["GliderID"])
-        glider_model = glider_dict.get(row["GliderType"])
-        p1_name = member_dict.get(row["P1"])
-        if pd.isna(row["P2"]):
-            p2_name = ""
-        else:
-            p2_name = member_dict.get(row["P2"], "<hidden>")
-
-        pilog_log_book.add_aircraft_model(glider_model, glider_registration)
-        added = pilog_log_book.add_flight_log_glider(
-            row["DateFlown"],
-            PLACE_NAME,
-            normalize_time(row["LaunchTime"]),
-            PLACE_NAME,
-            normalize_time(row["LandTime"]),
-            glider_model,
-            glider_registration,
-            DEFAULT_LAUNCH_TYPE,
-            1,
-            p1_name,
-            p2_name,
+
+    databases = load_databases()
+    print("Load members from Members.xlsx")
+    club_members = ClubMembers(
+        "Members.xlsx",
+        [database.member_id_column for database in databases if database.member_id_column],
+    )
+    print("Loaded members", len(club_members.members))
+    for database in databases:
+        print(f"Load database from {database.path}...")
+
+    # Exported files are written in full, the mirror is only for Google Sheets
+    mirror = None
+    if not args.export and not args.no_cache and LOGBOOK_CACHE_PATH:
+        mirror = LogbookMirror(LOGBOOK_CACHE_PATH)
+
+    logbook_sync = LogbookSync(
+        credentials,
+        club_members,
+        databases,
+        keep_logbooks_open=args.watch,
+        mirror=mirror,
+    )
+
+    # Start watching before the first read, so changes made while the initial
+    # sync is running trigger the next cycle.
+    watcher = None
+    if args.watch:
+        watcher = DatabaseWatcher(
+            [database.path for database in databases],
+            poll_interval=WATCH_POLL_INTERVAL,
+            debounce=WATCH_DEBOUNCE_SECONDS,
         )
-        if added is True:
-            count += 1
-    tqdm.write(f"Added {count} rows for {member.name}")
-    if count > 0:
-        tqdm.write(
-            f"Save {count} flight log and aircraft models for {member.name} - processing..."
+
+    print("Reading tables")
+    logbook_sync.load_tables()
+    if args.export:
+        export_logbooks(
+            logbook_sync, club_members.members, args.export, args.export_format
         )
-        try:
-            pilog_log_book.save_aircraft_model()
-            pilog_log_book.save_flight_log_glider()
-            tqdm.write(
-                f"Save {count} flight log and aircraft models for {member.name} - saved"
-            )
-            tqdm.write(f"Sync count for {member.name} has been updated to {rows_count}")
-        except Exception as e:
-            tqdm.write(
-                f"Save {count} flight log and aircraft models for {member.name} - error ({e})"
-            )
-        try:
-            pilog_log_book.update_filters()
-            pilog_log_book.update_tick_boxes()
-            pilog_log_book.update_cell_formating()
-        except Exception as e:
-            tqdm.write(f"Error update filters and cell formating for {member.name} - {e}")
-    if member.sync_count != rows_count:
-        member.sync_count = rows_count
-        club_members.save()
-
-print("All steps done.")
+    else:
+        logbook_sync.sync_members(club_members.members)
+
+    print("All steps done.")
+
+    if watcher is not None:
+        watch(watcher, logbook_sync, club_members)
+
+
+if __name__ == "__main__":
+    # Exports run in a process pool, which needs this in a PyInstaller build
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,137 @@
+from types import SimpleNamespace
+
+import pytest
+
+import app.sync
+from app.club_members.schemas import ClubMemberSchema
+from app.databases import FLIGHT_TIME_TABLE
+from app.databases.schemas import DatabaseSchema
+from app.pilot_logbook.local import LocalLogBook
+from app.sync import LogbookSync, add_flights
+
+
+ALICE, BOB, CAROL = 1, 2, 3
+
+
+def make_flight(auto_id, p1, glider_id=1, p2=None, land_time=None):
+    return {
+        "AutoID": auto_id,
+        "DateFlown": "2025-05-01",
+        "P1": p1,
+        "P2": p2,
+        "GliderID": glider_id,
+        "GliderType": 1,
+        "LaunchTime": f"1{auto_id}:00",
+        "LandTime": land_time,
+    }
+
+
+class FakeDatabase:
+    """tblFlightTime and lookup tables of one Access database"""
+
+    def __init__(self, flights):
+        self.flights = flights
+        self.gliders = {1: "G-AAAA"}
+        self.fail_lookup_read = False
+
+    def read_tables(self, table_names, db_path=None):
+        tables = {}
+        if FLIGHT_TIME_TABLE in table_names:
+            tables[FLIGHT_TIME_TABLE] = {
+                key: [i[key] for i in self.flights] for key in self.flights[0]
+            }
+        if "tblMember" in table_names:
+            if self.fail_lookup_read:
+                raise OSError("database is locked")
+            tables["tblGliderDetails"] = {
+                "AutoID": list(self.gliders), "GliderID": list(self.gliders.values())
+            }
+            tables["TblGliderType"] = {"TypeId": [1], "GliderType": ["ASK 21"]}
+            tables["tblMember"] = {
+                "MemberID": [ALICE, BOB, CAROL], "Name": ["Alice", "Bob", "Carol"]
+            }
+        return tables
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase([make_flight(1, ALICE)])
+    monkeypatch.setattr(app.sync, "read_tables", database.read_tables)
+    return database
+
+
+@pytest.fixture
+def logbook_sync(database):
+    members = [
+        ClubMemberSchema(club_id=i, name=name, spreadsheet_key=name)
+        for i, name in ((ALICE, "Alice"), (BOB, "Bob"), (CAROL, "Carol"))
+    ]
+    logbook_sync = LogbookSync(
+        None,
+        SimpleNamespace(members=members, save=lambda: None),
+        [DatabaseSchema(path="club.accdb", place_name="Field")],
+    )
+    logbook_sync.load_tables()
+    return logbook_sync
+
+
+def sync(logbook_sync, tmp_path, club_id):
+    """Syncs a member to a local logbook like LogbookSync.sync_member does"""
+    member = next(i for i in logbook_sync.club_members.members if i.club_id == club_id)
+    filename = str(tmp_path / f"{member.name}.csv")
+    logbook = LocalLogBook(filename, member.name)
+    add_flights(
+        logbook,
+        logbook_sync.get_member_flights(member),
+        logbook_sync.replaced_flights.get(club_id),
+    )
+    logbook.save_aircraft_model()
+    logbook.save_flight_log_glider()
+    logbook.finalize()
+    logbook_sync.replaced_flights.pop(club_id, None)
+    logbook_sync.pending_member_ids.discard(club_id)
+    return LocalLogBook(filename, member.name).flight_log_glider
+
+
+def test_edit_after_lookup_reload_replaces_row(database, logbook_sync, tmp_path):
+    sync(logbook_sync, tmp_path, ALICE)
+
+    # A flight in a new glider makes the lookup tables to be re-read
+    database.gliders[2] = "G-BBBB"
+    database.flights.append(make_flight(2, BOB, glider_id=2))
+    assert logbook_sync.reload_tables() == {BOB}
+    sync(logbook_sync, tmp_path, BOB)
+
+    database.flights[0] = make_flight(1, ALICE, land_time="11:30")
+    assert logbook_sync.reload_tables() == {ALICE}
+    rows = sync(logbook_sync, tmp_path, ALICE)
+    assert [(i[6], i[8]) for i in rows] == [("11:00", "11:30")]
+
+
+def test_failed_lookup_read_keeps_changes(database, logbook_sync, tmp_path):
+    sync(logbook_sync, tmp_path, ALICE)
+
+    database.gliders[2] = "G-BBBB"
+    database.flights[0] = make_flight(1, ALICE, glider_id=2, land_time="11:30")
+    database.fail_lookup_read = True
+    with pytest.raises(OSError):
+        logbook_sync.reload_tables()
+
+    database.fail_lookup_read = False
+    assert logbook_sync.reload_tables() == {ALICE}
+    rows = sync(logbook_sync, tmp_path, ALICE)
+    assert [(i[4], i[8]) for i in rows] == [("G-BBBB", "11:30")]
+
+
+def test_changed_pilot_removes_old_row(database, logbook_sync, tmp_path):
+    database.flights[0] = make_flight(1, ALICE, p2=BOB)
+    logbook_sync.reload_tables()
+    sync(logbook_sync, tmp_path, ALICE)
+    assert len(sync(logbook_sync, tmp_path, BOB)) == 1
+
+    database.flights[0] = make_flight(1, ALICE, p2=CAROL)
+    assert logbook_sync.reload_tables() == {ALICE, BOB, CAROL}
+    assert logbook_sync.pending_member_ids == {ALICE, BOB, CAROL}
+    assert sync(logbook_sync, tmp_path, BOB) == []
+    assert len(sync(logbook_sync, tmp_path, CAROL)) == 1
+    assert [i[2] for i in sync(logbook_sync, tmp_path, ALICE)] == ["Carol"]